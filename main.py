@@ -8,14 +8,65 @@ try
 
 import http.server
 import socketserver
+import gzip
 import json
 import random
+import socket
+import tempfile
+import threading
 import time
-from urllib.parse import parse_qs, urlparse
+from bisect import bisect
+from itertools import accumulate
 import os
 
 PORT = 8000
 
+# Per-request logging is off unless SPIRIT_LOG=1
+LOG_REQUESTS = os.environ.get('SPIRIT_LOG') == '1'
+
+# Read the page once at startup so serving "/" never touches the disk
+HTML_FILE = os.path.join(os.path.dirname(__file__), 'game.html')
+try:
+    with open(HTML_FILE, 'rb') as f:
+        HTML_BYTES = f.read()
+    HTML_GZ = gzip.compress(HTML_BYTES)
+except FileNotFoundError:
+    HTML_BYTES = None
+    HTML_GZ = None
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header value allows a gzip response"""
+    gzip_q = None
+    any_q = None
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name in ('gzip', 'x-gzip'):
+            gzip_q = q
+        elif name == '*':
+            any_q = q
+
+    # "*" only covers gzip when gzip isn't listed on its own
+    if gzip_q is None:
+        gzip_q = any_q
+    return bool(gzip_q)
+
+# Private copy of the page for os.sendfile, so uncompressed responses go
+# from the page cache straight to the socket without a userspace copy
+HTML_SPOOL = None
+if HTML_BYTES is not None and hasattr(os, 'sendfile'):
+    HTML_SPOOL = tempfile.TemporaryFile()
+    HTML_SPOOL.write(HTML_BYTES)
+    HTML_SPOOL.flush()
+
 # Game constants
 EVOLUTION_STAGES = [
     {"name": "Egg", "days_required": 0, "emoji": "🥚"},
@@ -25,7 +76,37 @@ EVOLUTION_STAGES = [
     {"name": "Ancient Spirit", "days_required": 8, "emoji": "🐉"}
 ]
 
-RANDOM_EVENTS = [
+# Stats are stored as integer milli-points: 100 points == STAT_MAX
+STAT_SCALE = 1000
+STAT_MAX = 100 * STAT_SCALE
+
+# Flat per-field views of EVOLUTION_STAGES for the evolve checks
+_STAGE_NAMES = tuple(stage["name"] for stage in EVOLUTION_STAGES)
+_STAGE_DAYS = tuple(stage["days_required"] for stage in EVOLUTION_STAGES)
+_NUM_STAGES = len(EVOLUTION_STAGES)
+
+# Each stage pre-serialized once, spliced into responses by encode_with_stage
+_STAGE_JSON = tuple(json.dumps(stage).encode('ascii') for stage in EVOLUTION_STAGES)
+
+# Time is consumed in whole steps so integer stats lose nothing to rounding;
+# per step, hunger/happiness decay 0.3/s, health falls 0.1/s or regains 0.05/s
+_STEP_SECONDS = 0.02
+_DECAY_PER_STEP = 6
+_HEALTH_LOSS_PER_STEP = 2
+_HEALTH_GAIN_PER_STEP = 1
+
+# Updates closer together than this (in seconds) are skipped; the elapsed
+# time carries over to the next update
+_MIN_UPDATE_INTERVAL = 0.05
+
+# 30 seconds = 1 day; random events are rolled at most once a minute
+DAY_SECONDS = 30
+EVENT_CHECK_SECONDS = 60
+
+# Every stat must be at least this high to evolve
+_MIN_EVOLVE_STAT = 50
+
+RANDOM_EVENTS = (
     {
         "name": "Shiny Stone",
         "message": "✨ {name} found a shiny stone and is delighted!",
@@ -80,326 +161,568 @@ RANDOM_EVENTS = [
         "effects": {"health": 20, "happiness": 10},
         "emoji": "🌙"
     }
-]
+)
+
+# Running total of event weights (an event's "weight" defaults to 1), so a
+# weighted pick is one bisect instead of a scan
+_EVENT_CUM_WEIGHTS = tuple(accumulate(event.get("weight", 1) for event in RANDOM_EVENTS))
+
+# Flavor text for each action, formatted with the spirit's name
+FEED_MESSAGES = (
+    "{name} happily munches on spiritual energy! ✨",
+    "{name} glows brighter as it feeds! 🌟",
+    "{name} feels nourished and content! 💫"
+)
+
+PLAY_MESSAGES = (
+    "{name} playfully dances around you! 💃",
+    "{name} sparkles with joy! ✨😊",
+    "{name} does a happy spin! 🌀"
+)
+
+REST_MESSAGES = (
+    "{name} curls up and rests peacefully... 😴",
+    "{name} takes a rejuvenating nap! 💤",
+    "{name} meditates and restores energy! 🧘"
+)
+
+TRAIN_MESSAGES = (
+    "{name} practices spiritual techniques! 🥋",
+    "{name} trains diligently! 💪",
+    "{name} masters a new skill! 🎯"
+)
+
+MEDITATE_MESSAGES = (
+    "{name} enters a meditative state... 🧘‍♀️✨",
+    "{name} connects with cosmic energy! 🌌",
+    "{name} achieves inner peace! ☯️"
+)
+
+GROOM_MESSAGES = (
+    "{name} enjoys being groomed! ✨🪮",
+    "You tend to {name}'s form! 🌟",
+    "{name} feels pampered! 💆‍♀️💕"
+)
+
+EXPLORE_OUTCOMES = ("great", "good", "neutral", "bad")
+
+# Bound once so the action handlers skip the module attribute lookups
+_choice = random.choice
+_randint = random.randint
+_randrange = random.randrange
+_random = random.random
+
+# Monotonic so elapsed-time math is immune to wall-clock jumps
+_now = time.monotonic
+
+# Converts _now() readings to epoch seconds for API responses; fixed at
+# startup so the reported times stay stable between calls
+_WALL_OFFSET = time.time() - _now()
+
+class GameState:
+    """State of the current spirit, stored in slots for fast attribute access"""
+    __slots__ = (
+        "name", "hunger", "happiness", "health", "age_days", "evolution_stage",
+        "interactions", "events_experienced", "is_alive", "start_time",
+        "last_update", "next_day_update", "next_event_check"
+    )
+
+    def __init__(self, name="Spirit"):
+        self.reset(name)
+
+    def reset(self, name="Spirit"):
+        """Start a fresh game in place"""
+        now = _now()
+        self.name = name
+        self.hunger = 50 * STAT_SCALE
+        self.happiness = 50 * STAT_SCALE
+        self.health = 50 * STAT_SCALE
+        self.age_days = 0
+        self.evolution_stage = 0
+        self.interactions = 0
+        self.events_experienced = 0
+        self.is_alive = True
+        # Wall-clock start for display; elapsed-time fields use _now()
+        self.start_time = time.time()
+        self.last_update = now
+        self.next_day_update = now + DAY_SECONDS
+        self.next_event_check = now + EVENT_CHECK_SECONDS
+
+    def to_dict(self):
+        """Return the state as a JSON-serializable dict (stats in points, times in epoch seconds)"""
+        # Keeps the public field names; the timers are stored as the next
+        # eligible time, so the last one is an interval earlier
+        return {
+            "name": self.name,
+            "hunger": self.hunger / STAT_SCALE,
+            "happiness": self.happiness / STAT_SCALE,
+            "health": self.health / STAT_SCALE,
+            "age_days": self.age_days,
+            "evolution_stage": self.evolution_stage,
+            "interactions": self.interactions,
+            "events_experienced": self.events_experienced,
+            "is_alive": self.is_alive,
+            "start_time": self.start_time,
+            "last_update": self.last_update + _WALL_OFFSET,
+            "last_day_update": self.next_day_update - DAY_SECONDS + _WALL_OFFSET,
+            "last_event_check": self.next_event_check - EVENT_CHECK_SECONDS + _WALL_OFFSET
+        }
 
 # Simple in-memory game state (one game at a time)
-game_state = {
-    "name": "Spirit",
-    "hunger": 50.0,
-    "happiness": 50.0,
-    "health": 50.0,
-    "age_days": 0,
-    "evolution_stage": 0,
-    "interactions": 0,
-    "events_experienced": 0,
-    "is_alive": True,
-    "start_time": time.time(),
-    "last_update": time.time(),
-    "last_day_update": time.time(),
-    "last_event_check": time.time()
-}
+game_state = GameState()
 
-def clamp(value, min_val, max_val):
-    """Clamp a value between min and max"""
-    return max(min_val, min(max_val, value))
+# Bumped whenever game_state changes; served as the /api/state ETag
+_state_version = 0
+
+# Random per-process token, so versions from an earlier run never match
+_INSTANCE = os.urandom(4).hex()
+
+# Version at which each state field last changed, and the state as of the
+# last snapshot, for /api/state?since=<version> delta responses
+_field_versions = {}
+_last_snapshot = {}
+
+# Requests are handled on multiple threads; hold this while reading or
+# mutating game_state
+state_lock = threading.Lock()
+
+def encode_json(obj):
+    """JSON-encode obj to bytes"""
+    # json.dumps escapes non-ASCII (names, emoji) by default, so this is a
+    # plain ASCII copy rather than a UTF-8 encode
+    return json.dumps(obj).encode('ascii')
+
+def encode_with_stage(response, stage):
+    """JSON-encode a non-empty response dict with the given stage spliced in"""
+    return encode_json(response)[:-1] + b', "stage": ' + _STAGE_JSON[stage] + b'}'
+
+def snapshot_state(since=None):
+    """Return game_state as a dict, or only the fields changed after since"""
+    global _last_snapshot
+
+    state = game_state.to_dict()
+    for field, value in state.items():
+        if field not in _last_snapshot or _last_snapshot[field] != value:
+            _field_versions[field] = _state_version
+    _last_snapshot = state
+
+    if since is None:
+        return state
+    return {field: value for field, value in state.items() if _field_versions[field] > since}
+
+def _add(gs, stat, points):
+    """Add whole points to a stat, keeping it within 0..STAT_MAX"""
+    value = getattr(gs, stat) + points * STAT_SCALE
+    setattr(gs, stat, 0 if value < 0 else STAT_MAX if value > STAT_MAX else value)
+
+def tick(gs, now):
+    """Advance gs to clock reading now; returns True if anything changed
+
+    Works on any GameState and takes the clock as an argument, so offline
+    simulations can run many spirits on a virtual clock without the server.
+    """
+    if not gs.is_alive:
+        return False
+
+    time_diff = now - gs.last_update
+    if time_diff < _MIN_UPDATE_INTERVAL:
+        return False
+
+    # Only advance by whole steps; the leftover carries into the next tick
+    steps = int(time_diff / _STEP_SECONDS)
+    gs.last_update += steps * _STEP_SECONDS
 
-def update_stats():
-    """Update stats based on time passed"""
-    global game_state
-    
-    if not game_state["is_alive"]:
-        return
-    
-    now = time.time()
-    time_diff = now - game_state["last_update"]
-    game_state["last_update"] = now
-    
     # Decay: -3 every 10 seconds = -18 per minute = -0.3 per second
-    decay_rate = 0.3
-    game_state["hunger"] = max(0, game_state["hunger"] - (decay_rate * time_diff))
-    game_state["happiness"] = max(0, game_state["happiness"] - (decay_rate * time_diff))
-    
+    decay = _DECAY_PER_STEP * steps
+    gs.hunger = max(0, gs.hunger - decay)
+    gs.happiness = max(0, gs.happiness - decay)
+
     # Health affected by hunger and happiness
-    if game_state["hunger"] < 30 or game_state["happiness"] < 30:
-        game_state["health"] = max(0, game_state["health"] - (0.1 * time_diff))
-    elif game_state["hunger"] > 70 and game_state["happiness"] > 70:
-        game_state["health"] = min(100, game_state["health"] + (0.05 * time_diff))
-    
+    if gs.hunger < 30 * STAT_SCALE or gs.happiness < 30 * STAT_SCALE:
+        gs.health = max(0, gs.health - _HEALTH_LOSS_PER_STEP * steps)
+    elif gs.hunger > 70 * STAT_SCALE and gs.happiness > 70 * STAT_SCALE:
+        gs.health = min(STAT_MAX, gs.health + _HEALTH_GAIN_PER_STEP * steps)
+
     # Check death
-    if game_state["hunger"] <= 0 or game_state["happiness"] <= 0 or game_state["health"] <= 0:
-        game_state["is_alive"] = False
-    
-    # Update days (30 seconds = 1 day)
-    if now - game_state["last_day_update"] >= 30:
-        game_state["age_days"] += 1
-        game_state["last_day_update"] = now
+    if gs.hunger <= 0 or gs.happiness <= 0 or gs.health <= 0:
+        gs.is_alive = False
+
+    # Update days
+    if now >= gs.next_day_update:
+        gs.age_days += 1
+        gs.next_day_update = now + DAY_SECONDS
+
+    return True
+
+def update_stats():
+    """Update stats based on time passed"""
+    global _state_version
+
+    if tick(game_state, _now()):
+        _state_version += 1
 
 def check_random_event():
     """Check if a random event should occur"""
-    global game_state
-    
-    if not game_state["is_alive"]:
+    global _state_version
+
+    gs = game_state
+    if not gs.is_alive:
         return None
-    
-    now = time.time()
-    if now - game_state["last_event_check"] >= 60:  # Check every 60 seconds
-        game_state["last_event_check"] = now
+
+    now = _now()
+    if now < gs.next_event_check:
+        return None
+    gs.next_event_check = now + EVENT_CHECK_SECONDS
+    _state_version += 1
+
+    if _random() < 0.20:  # 20% chance
+        event = RANDOM_EVENTS[bisect(_EVENT_CUM_WEIGHTS, _random() * _EVENT_CUM_WEIGHTS[-1])]
         
-        if random.random() < 0.20:  # 20% chance
-            event = random.choice(RANDOM_EVENTS)
-            
-            # Apply effects
-            if "hunger" in event["effects"]:
-                game_state["hunger"] = clamp(game_state["hunger"] + event["effects"]["hunger"], 0, 100)
-            if "happiness" in event["effects"]:
-                game_state["happiness"] = clamp(game_state["happiness"] + event["effects"]["happiness"], 0, 100)
-            if "health" in event["effects"]:
-                game_state["health"] = clamp(game_state["health"] + event["effects"]["health"], 0, 100)
-            
-            game_state["events_experienced"] += 1
-            return event
-    
+        # Apply effects
+        for stat, points in event["effects"].items():
+            _add(gs, stat, points)
+        
+        gs.events_experienced += 1
+        return event
+
     return None
 
+def _feed(gs):
+    """Feed the spirit"""
+    if gs.hunger >= 95 * STAT_SCALE:
+        return f"{gs.name} is already full! 🍽️"
+    # One draw covers both rolls: r % 11 and r // 11 are independent and uniform
+    r = _randrange(11 * 6)
+    _add(gs, "hunger", 15 + r % 11)
+    _add(gs, "health", 5 + r // 11)
+    gs.interactions += 1
+    return _choice(FEED_MESSAGES).format(name=gs.name)
+
+def _play(gs):
+    """Play with the spirit"""
+    if gs.happiness >= 95 * STAT_SCALE:
+        return f"{gs.name} is already very happy! 😊"
+    # One draw for both rolls, as in _feed
+    r = _randrange(11 * 6)
+    _add(gs, "happiness", 15 + r % 11)
+    _add(gs, "hunger", -(5 + r // 11))
+    gs.interactions += 1
+    return _choice(PLAY_MESSAGES).format(name=gs.name)
+
+def _rest(gs):
+    """Let the spirit rest"""
+    if gs.health >= 95 * STAT_SCALE:
+        return f"{gs.name} is already well-rested! 😴"
+    # One draw for both rolls, as in _feed
+    r = _randrange(11 * 6)
+    _add(gs, "health", 20 + r % 11)
+    _add(gs, "happiness", 5 + r // 11)
+    gs.interactions += 1
+    return _choice(REST_MESSAGES).format(name=gs.name)
+
+def _train(gs):
+    """Train the spirit"""
+    _add(gs, "health", _randint(12, 18))
+    _add(gs, "happiness", _randint(10, 15))
+    _add(gs, "hunger", -_randint(15, 20))
+    gs.interactions += 1
+    return _choice(TRAIN_MESSAGES).format(name=gs.name)
+
+def _explore(gs):
+    """Send the spirit exploring with a random outcome"""
+    outcome = EXPLORE_OUTCOMES[int(_random() * len(EXPLORE_OUTCOMES))]
+
+    if outcome == "great":
+        _add(gs, "happiness", _randint(20, 30))
+        _add(gs, "hunger", _randint(10, 20))
+        _add(gs, "health", _randint(5, 15))
+        message = f"{gs.name} discovers a magical paradise! 🌺✨"
+    elif outcome == "good":
+        _add(gs, "happiness", _randint(15, 20))
+        _add(gs, "hunger", _randint(5, 10))
+        message = f"{gs.name} has a pleasant adventure! 🗺️"
+    elif outcome == "neutral":
+        _add(gs, "happiness", _randint(5, 10))
+        _add(gs, "hunger", -_randint(5, 10))
+        message = f"{gs.name} wanders around safely. 🚶"
+    else:
+        _add(gs, "happiness", -_randint(10, 15))
+        _add(gs, "health", -_randint(10, 15))
+        _add(gs, "hunger", -_randint(5, 10))
+        message = f"{gs.name} gets lost and returns tired... 😰"
+
+    gs.interactions += 1
+    return message
+
+def _meditate(gs):
+    """Meditate with the spirit"""
+    _add(gs, "health", _randint(10, 15))
+    _add(gs, "happiness", _randint(10, 15))
+    _add(gs, "hunger", _randint(8, 12))
+    gs.interactions += 1
+    return _choice(MEDITATE_MESSAGES).format(name=gs.name)
+
+def _groom(gs):
+    """Groom the spirit"""
+    if gs.happiness >= 90 * STAT_SCALE and gs.health >= 90 * STAT_SCALE:
+        return f"{gs.name} is already pristine! ✨"
+    _add(gs, "happiness", _randint(12, 18))
+    _add(gs, "health", _randint(8, 12))
+    gs.interactions += 1
+    return _choice(GROOM_MESSAGES).format(name=gs.name)
+
+def _evolve(gs):
+    """Evolve the spirit if it is old and healthy enough"""
+    stage = gs.evolution_stage
+    next_stage = stage + 1
+
+    if next_stage >= _NUM_STAGES:
+        return f"🌟 {gs.name} is at maximum evolution!"
+    if gs.age_days < _STAGE_DAYS[next_stage]:
+        days_needed = _STAGE_DAYS[next_stage] - gs.age_days
+        return f"❌ Need {days_needed} more day(s) to evolve!"
+    if min(gs.hunger, gs.happiness, gs.health) < _MIN_EVOLVE_STAT * STAT_SCALE:
+        return f"❌ All stats must be above {_MIN_EVOLVE_STAT} to evolve!"
+
+    gs.evolution_stage = next_stage
+
+    _add(gs, "hunger", 20)
+    _add(gs, "happiness", 20)
+    _add(gs, "health", 20)
+
+    return f"✨ EVOLUTION! ✨\n{_STAGE_NAMES[stage]} → {_STAGE_NAMES[next_stage]}!"
+
+# Action name -> handler; each handler mutates the state and returns a message
+_ACTIONS = {
+    "feed": _feed,
+    "play": _play,
+    "rest": _rest,
+    "train": _train,
+    "explore": _explore,
+    "meditate": _meditate,
+    "groom": _groom,
+    "evolve": _evolve
+}
+
 def perform_action(action):
     """Perform a game action"""
-    global game_state
-    
+    global _state_version
+
     update_stats()
-    
-    if not game_state["is_alive"]:
+    gs = game_state
+
+    if not gs.is_alive:
         return {"success": False, "message": "Your spirit has faded..."}
-    
-    message = ""
-    
-    if action == "feed":
-        if game_state["hunger"] >= 95:
-            message = f"{game_state['name']} is already full! 🍽️"
-        else:
-            game_state["hunger"] = min(100, game_state["hunger"] + random.randint(15, 25))
-            game_state["health"] = min(100, game_state["health"] + random.randint(5, 10))
-            game_state["interactions"] += 1
-            messages = [
-                f"{game_state['name']} happily munches on spiritual energy! ✨",
-                f"{game_state['name']} glows brighter as it feeds! 🌟",
-                f"{game_state['name']} feels nourished and content! 💫"
-            ]
-            message = random.choice(messages)
-    
-    elif action == "play":
-        if game_state["happiness"] >= 95:
-            message = f"{game_state['name']} is already very happy! 😊"
-        else:
-            game_state["happiness"] = min(100, game_state["happiness"] + random.randint(15, 25))
-            game_state["hunger"] = max(0, game_state["hunger"] - random.randint(5, 10))
-            game_state["interactions"] += 1
-            messages = [
-                f"{game_state['name']} playfully dances around you! 💃",
-                f"{game_state['name']} sparkles with joy! ✨😊",
-                f"{game_state['name']} does a happy spin! 🌀"
-            ]
-            message = random.choice(messages)
-    
-    elif action == "rest":
-        if game_state["health"] >= 95:
-            message = f"{game_state['name']} is already well-rested! 😴"
-        else:
-            game_state["health"] = min(100, game_state["health"] + random.randint(20, 30))
-            game_state["happiness"] = min(100, game_state["happiness"] + random.randint(5, 10))
-            game_state["interactions"] += 1
-            messages = [
-                f"{game_state['name']} curls up and rests peacefully... 😴",
-                f"{game_state['name']} takes a rejuvenating nap! 💤",
-                f"{game_state['name']} meditates and restores energy! 🧘"
-            ]
-            message = random.choice(messages)
-    
-    elif action == "train":
-        game_state["health"] = min(100, game_state["health"] + random.randint(12, 18))
-        game_state["happiness"] = min(100, game_state["happiness"] + random.randint(10, 15))
-        game_state["hunger"] = max(0, game_state["hunger"] - random.randint(15, 20))
-        game_state["interactions"] += 1
-        messages = [
-            f"{game_state['name']} practices spiritual techniques! 🥋",
-            f"{game_state['name']} trains diligently! 💪",
-            f"{game_state['name']} masters a new skill! 🎯"
-        ]
-        message = random.choice(messages)
-    
-    elif action == "explore":
-        outcome = random.choice(["great", "good", "neutral", "bad"])
-        
-        if outcome == "great":
-            game_state["happiness"] = min(100, game_state["happiness"] + random.randint(20, 30))
-            game_state["hunger"] = min(100, game_state["hunger"] + random.randint(10, 20))
-            game_state["health"] = min(100, game_state["health"] + random.randint(5, 15))
-            message = f"{game_state['name']} discovers a magical paradise! 🌺✨"
-        elif outcome == "good":
-            game_state["happiness"] = min(100, game_state["happiness"] + random.randint(15, 20))
-            game_state["hunger"] = min(100, game_state["hunger"] + random.randint(5, 10))
-            message = f"{game_state['name']} has a pleasant adventure! 🗺️"
-        elif outcome == "neutral":
-            game_state["happiness"] = min(100, game_state["happiness"] + random.randint(5, 10))
-            game_state["hunger"] = max(0, game_state["hunger"] - random.randint(5, 10))
-            message = f"{game_state['name']} wanders around safely. 🚶"
-        else:
-            game_state["happiness"] = max(0, game_state["happiness"] - random.randint(10, 15))
-            game_state["health"] = max(0, game_state["health"] - random.randint(10, 15))
-            game_state["hunger"] = max(0, game_state["hunger"] - random.randint(5, 10))
-            message = f"{game_state['name']} gets lost and returns tired... 😰"
-        
-        game_state["interactions"] += 1
-    
-    elif action == "meditate":
-        game_state["health"] = min(100, game_state["health"] + random.randint(10, 15))
-        game_state["happiness"] = min(100, game_state["happiness"] + random.randint(10, 15))
-        game_state["hunger"] = min(100, game_state["hunger"] + random.randint(8, 12))
-        game_state["interactions"] += 1
-        messages = [
-            f"{game_state['name']} enters a meditative state... 🧘‍♀️✨",
-            f"{game_state['name']} connects with cosmic energy! 🌌",
-            f"{game_state['name']} achieves inner peace! ☯️"
-        ]
-        message = random.choice(messages)
-    
-    elif action == "groom":
-        if game_state["happiness"] >= 90 and game_state["health"] >= 90:
-            message = f"{game_state['name']} is already pristine! ✨"
-        else:
-            game_state["happiness"] = min(100, game_state["happiness"] + random.randint(12, 18))
-            game_state["health"] = min(100, game_state["health"] + random.randint(8, 12))
-            game_state["interactions"] += 1
-            messages = [
-                f"{game_state['name']} enjoys being groomed! ✨🪮",
-                f"You tend to {game_state['name']}'s form! 🌟",
-                f"{game_state['name']} feels pampered! 💆‍♀️💕"
-            ]
-            message = random.choice(messages)
-    
-    elif action == "evolve":
-        if game_state["evolution_stage"] >= len(EVOLUTION_STAGES) - 1:
-            message = f"🌟 {game_state['name']} is at maximum evolution!"
-        else:
-            next_stage = EVOLUTION_STAGES[game_state["evolution_stage"] + 1]
-            
-            if game_state["age_days"] < next_stage["days_required"]:
-                days_needed = next_stage["days_required"] - game_state["age_days"]
-                message = f"❌ Need {days_needed} more day(s) to evolve!"
-            elif game_state["hunger"] < 50 or game_state["happiness"] < 50 or game_state["health"] < 50:
-                message = "❌ All stats must be above 50 to evolve!"
-            else:
-                old_stage = EVOLUTION_STAGES[game_state["evolution_stage"]]
-                game_state["evolution_stage"] += 1
-                new_stage = EVOLUTION_STAGES[game_state["evolution_stage"]]
-                
-                game_state["hunger"] = min(100, game_state["hunger"] + 20)
-                game_state["happiness"] = min(100, game_state["happiness"] + 20)
-                game_state["health"] = min(100, game_state["health"] + 20)
-                
-                message = f"✨ EVOLUTION! ✨\n{old_stage['name']} → {new_stage['name']}!"
-    
-    else:
+
+    handler = _ACTIONS.get(action)
+    if handler is None:
         return {"error": "Invalid action"}
-    
+
+    message = handler(gs)
+    _state_version += 1
+
+    # The handler splices in the current stage when encoding
     return {
         "success": True,
         "message": message,
-        "state": game_state,
-        "stage": EVOLUTION_STAGES[game_state["evolution_stage"]]
+        "state": snapshot_state()
     }
 
 
+class ThreadedServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """HTTP server that handles each request on its own thread"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+
 class GameHandler(http.server.SimpleHTTPRequestHandler):
     """Custom HTTP request handler for the game"""
-    
+
+    # Every response carries a Content-Length, so connections can stay open
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        """Disable Nagle's algorithm so small JSON replies go out immediately"""
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    # Status line and fixed headers shared by every JSON reply
+    _JSON_HEADERS = (
+        protocol_version.encode() + b" 200 OK\r\n"
+        b"Content-Type: application/json\r\n"
+    )
+
+    def _send_json(self, body, etag=None):
+        """Send an encoded JSON body with its status line and headers in one write"""
+        self.log_request(200)
+        self.wfile.write(
+            self._JSON_HEADERS
+            + b"Content-Length: %d\r\n" % len(body)
+            + (b"Connection: close\r\n" if self.close_connection else b"Connection: keep-alive\r\n")
+            + (b"ETag: %s\r\n" % etag.encode() if etag else b"")
+            + b"\r\n"
+            + body
+        )
+
     def do_GET(self):
         """Handle GET requests"""
-        parsed_path = urlparse(self.path)
+        qi = self.path.find('?')
+        path = self.path if qi < 0 else self.path[:qi]
         
-        if parsed_path.path == '/' or parsed_path.path == '/index.html':
-            # Serve the HTML file
+        if path == '/' or path == '/index.html':
+            # Serve the cached HTML file
+            if HTML_BYTES is None:
+                body = b"Error: game.html not found!"
+                self.send_response(200)
+                self.send_header('Content-type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            
+            use_gzip = accepts_gzip(self.headers.get('Accept-Encoding', ''))
+            body = HTML_GZ if use_gzip else HTML_BYTES
+            
             self.send_response(200)
-            self.send_header('Content-type', 'text/html')
+            self.send_header('Content-type', 'text/html; charset=utf-8')
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
             
-            # Read and serve the HTML file
-            html_file = os.path.join(os.path.dirname(__file__), 'game.html')
-            try:
-                with open(html_file, 'r', encoding='utf-8') as f:
-                    self.wfile.write(f.read().encode())
-            except FileNotFoundError:
-                self.wfile.write(b"Error: game.html not found!")
+            if use_gzip or HTML_SPOOL is None:
+                self.wfile.write(body)
+            else:
+                # Explicit offsets leave the shared file position untouched,
+                # so concurrent requests can send from the same spool
+                out_fd, in_fd, size = self.request.fileno(), HTML_SPOOL.fileno(), len(body)
+                offset = 0
+                while offset < size:
+                    offset += os.sendfile(out_fd, in_fd, offset, size - offset)
         
-        elif parsed_path.path == '/api/state':
-            # Get game state
-            update_stats()
-            event = check_random_event()
+        elif path == '/api/state':
+            # Get game state; ?since=<version>&instance=<instance> asks for
+            # changed fields only
+            since = None
+            instance = None
+            if qi >= 0:
+                for param in self.path[qi + 1:].split('&'):
+                    key, _, value = param.partition('=')
+                    if key == 'since':
+                        try:
+                            since = int(value)
+                        except ValueError:
+                            pass
+                    elif key == 'instance':
+                        instance = value
             
-            response = {
-                "state": game_state,
-                "stage": EVOLUTION_STAGES[game_state["evolution_stage"]]
-            }
+            # Versions from another server process say nothing about this one
+            if instance is not None and instance != _INSTANCE:
+                since = None
             
-            if event:
-                response["event"] = event
+            with state_lock:
+                update_stats()
+                event = check_random_event()
+                etag = f'"{_INSTANCE}-v{_state_version}"'
+                
+                # Nothing changed since the client's copy
+                if self.headers.get('If-None-Match') == etag:
+                    body = None
+                else:
+                    # A version from the future can't be diffed against
+                    if since is not None and since > _state_version:
+                        since = None
+                    
+                    response = {
+                        "version": _state_version,
+                        "instance": _INSTANCE,
+                        "state": snapshot_state(since)
+                    }
+                    
+                    if since is not None:
+                        response["delta"] = True
+                    
+                    if event:
+                        response["event"] = event
+                    
+                    body = encode_with_stage(response, game_state.evolution_stage)
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
+            if body is None:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+            else:
+                self._send_json(body, etag=etag)
         
         else:
             self.send_error(404)
-    
-    def do_POST(self):
-        """Handle POST requests"""
-        parsed_path = urlparse(self.path)
+
+    def _start_game(self, post_data):
+        """Start a new game (POST /api/start)"""
+        data = json.loads(post_data.decode())
         
-        if parsed_path.path == '/api/start':
-            # Start new game
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode())
+        global _state_version
+        with state_lock:
+            game_state.reset(data.get('name', 'Spirit'))
+            _state_version += 1
             
-            global game_state
-            game_state = {
-                "name": data.get('name', 'Spirit'),
-                "hunger": 50.0,
-                "happiness": 50.0,
-                "health": 50.0,
-                "age_days": 0,
-                "evolution_stage": 0,
-                "interactions": 0,
-                "events_experienced": 0,
-                "is_alive": True,
-                "start_time": time.time(),
-                "last_update": time.time(),
-                "last_day_update": time.time(),
-                "last_event_check": time.time()
+            response = {
+                "success": True,
+                "version": _state_version,
+                "instance": _INSTANCE,
+                "state": snapshot_state()
             }
-            
-            response = {"success": True, "state": game_state}
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
+            body = encode_json(response)
         
-        elif parsed_path.path.startswith('/api/action/'):
-            # Perform action
-            action = parsed_path.path.split('/')[-1]
+        self._send_json(body)
+
+    def _perform_action(self, action):
+        """Perform an action (POST /api/action/<action>)"""
+        with state_lock:
             result = perform_action(action)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            if "state" in result:
+                result["version"] = _state_version
+                result["instance"] = _INSTANCE
+                body = encode_with_stage(result, game_state.evolution_stage)
+            else:
+                body = encode_json(result)
+        
+        self._send_json(body)
+
+    # Exact-match POST routes; /api/action/<action> is handled by prefix
+    _POST_ROUTES = {'/api/start': _start_game}
+
+    def do_POST(self):
+        """Handle POST requests"""
+        # The API takes no query parameters, so just drop any query string
+        qi = self.path.find('?')
+        path = self.path if qi < 0 else self.path[:qi]
+        
+        # Always consume the body, so on a kept-alive connection it can't be
+        # mistaken for the start of the next request
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            self.close_connection = True
+            self.send_error(400, "Bad Content-Length")
+            return
+        post_data = self.rfile.read(content_length)
         
+        route = self._POST_ROUTES.get(path)
+        if route is not None:
+            route(self, post_data)
+        elif path.startswith('/api/action/'):
+            self._perform_action(path[len('/api/action/'):])
         else:
             self.send_error(404)
-    
+
     def log_message(self, format, *args):
         """Override to customize logging"""
+        if not LOG_REQUESTS:
+            return
         # Only log important messages
         if '200' not in str(args[1]):
             return
@@ -416,10 +739,12 @@ def main():
     print("✅ Works perfectly in VS Code\n")
     print(f"📡 Server starting on port {PORT}...")
     print(f"🌐 Open your browser to: http://localhost:{PORT}")
+    if not LOG_REQUESTS:
+        print("📝 Request logging is off (set SPIRIT_LOG=1 to enable)")
     print("\n⚠️  Press CTRL+C to stop the server")
     print("="*60 + "\n")
-    
-    with socketserver.TCPServer(("", PORT), GameHandler) as httpd:
+
+    with ThreadedServer(("", PORT), GameHandler) as httpd:
         try:
             httpd.serve_forever()
         except KeyboardInterrupt: